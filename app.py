@@ -6,29 +6,47 @@ and serves the advanced UI.
 """
 
 import os
-from flask import Flask, render_template, request, jsonify, send_from_directory
+from flask import Flask, Response, render_template, request, jsonify, send_from_directory, stream_with_context
+from flask.json.provider import JSONProvider
 from dotenv import load_dotenv
 from werkzeug.utils import secure_filename
 import uuid
-import json
+import orjson
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
 # Load environment variables
 load_dotenv()
 
+class OrjsonProvider(JSONProvider):
+    """
+    Flask JSON provider backed by orjson, used by jsonify and request.json.
+    """
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
 # Initialize Flask app
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
 app.config['UPLOAD_FOLDER'] = 'uploads'
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
 
 # Import modules after app init to avoid circular imports
 from database import init_db, store_plan, get_all_plans, store_query
 from search_agent import generate_search_queries, find_and_extract_sources
-from planner import extract_num_days, break_into_steps, needs_weather, get_weather, generate_plan
+from planner import (extract_meta, break_into_steps, get_weather, generate_plan, get_cached_plan,
+                     stream_plan, finish_plan)
 
 # Initialize database
 init_db()
 
+# Seconds the streaming endpoint waits for its plan to be committed
+PLAN_SAVE_TIMEOUT = 10
+
 @app.route('/')
 def index():
     """
@@ -36,6 +54,66 @@ def index():
     """
     return render_template('index.html')
 
+def _gather_plan_inputs(goal):
+    """
+    Run the stages that feed plan generation: goal metadata, steps, sources and weather.
+    Metadata and steps start together. Once the day count is known, a cached plan for a
+    near-identical goal short-circuits the expensive search and extraction stage; on a
+    miss, sources and weather (which needs the city) run alongside the steps call.
+
+    Args:
+        goal (str): User's goal.
+
+    Returns:
+        tuple: (days, cached_plan, steps, sources, weather). On a cache hit only
+        days and cached_plan are set.
+    """
+    executor = ThreadPoolExecutor(max_workers=3)
+    try:
+        meta_future = executor.submit(extract_meta, goal)
+        steps_future = executor.submit(break_into_steps, goal)
+
+        meta = meta_future.result()
+        days = meta['days']
+        cached_plan = get_cached_plan(goal, days)
+        if cached_plan is not None:
+            return days, cached_plan, [], [], None
+
+        sources_future = executor.submit(find_and_extract_sources, goal, 3)
+        weather_future = None
+        if meta['needs_weather'] and meta['city']:
+            weather_future = executor.submit(get_weather, meta['city'], days)
+
+        steps = steps_future.result()
+        sources = sources_future.result()
+        weather = weather_future.result() if weather_future else None
+    finally:
+        # On a cache hit, don't hold the response for the steps call
+        executor.shutdown(wait=False)
+
+    if len(sources) < 2:
+        # Ensure at least 2 by searching more if needed
+        while len(sources) < 2:
+            additional_query = f"additional resources for {goal}"
+            additional_sources = find_and_extract_sources(additional_query, num_sources=1)
+            sources.extend(additional_sources)
+            sources = sources[:3]  # Cap at 3
+
+    return days, None, steps, sources, weather
+
+def _sse(event, data):
+    """
+    Format a Server-Sent Event.
+
+    Args:
+        event (str): Event name.
+        data (dict): JSON-serializable payload.
+
+    Returns:
+        str: Encoded event.
+    """
+    return f"event: {event}\ndata: {orjson.dumps(data).decode()}\n\n"
+
 @app.route('/generate_plan', methods=['POST'])
 def generate_plan_endpoint():
     """
@@ -51,51 +129,19 @@ def generate_plan_endpoint():
     # Generate unique session ID for progress tracking
     session_id = str(uuid.uuid4())
 
-    # Step 1: Extract days
-    days = extract_num_days(goal)
-
-    # Step 2: Break into steps
-    steps = break_into_steps(goal)
-    if not steps:
+    days, cached_plan, steps, sources, weather = _gather_plan_inputs(goal)
+    if cached_plan is None and not steps:
         return jsonify({'error': 'Failed to break goal into steps.'}), 500
 
-    # Emit progress (via SSE or polling, but for simplicity, return in batches)
     progress = {'session_id': session_id, 'step': 'searching', 'message': 'Generating search queries...', 'sources': []}
 
-    # Step 3: Find and extract sources with replacements for failures
-    sources = find_and_extract_sources(goal, num_sources=3)
-    if len(sources) < 2:
-        # Ensure at least 2 by searching more if needed
-        while len(sources) < 2:
-            additional_query = f"additional resources for {goal}"
-            additional_sources = find_and_extract_sources(additional_query, num_sources=1)
-            sources.extend(additional_sources)
-            sources = sources[:3]  # Cap at 3
-
     # Update progress with sources
     progress['sources'] = [{'url': s['url'], 'search_query': s['search_query']} for s in sources]
-    progress['message'] = 'Sources extracted. Fetching weather if needed...'
-
-    # Step 4: Get weather if needed
-    weather = None
-    if needs_weather(goal):
-        city_prompt = f"Extract the main city from this goal: {goal}. Output only the city name."
-        try:
-            from google.generativeai import GenerativeModel
-            import google.generativeai as genai
-            genai.configure(api_key=os.getenv('GEMINI_API_KEY'))
-            model = GenerativeModel('gemini-1.5-flash')
-            city_response = model.generate_content(city_prompt)
-            city = city_response.text.strip()
-            if city:
-                weather = get_weather(city, days)
-        except Exception as e:
-            pass  # Weather optional
 
     progress['message'] = 'Generating your personalized plan...'
 
-    # Step 5: Generate plan
-    plan = generate_plan(goal, steps, sources, weather, days)
+    # Step 5: Generate plan (unless a near-identical goal already has one)
+    plan = cached_plan or generate_plan(goal, steps, sources, weather, days)
     if "Error" in plan:
         return jsonify({'error': plan}), 500
 
@@ -110,13 +156,74 @@ def generate_plan_endpoint():
 
     return jsonify(progress)
 
+@app.route('/generate_plan_stream')
+def generate_plan_stream():
+    """
+    Streaming variant of /generate_plan using Server-Sent Events.
+    Emits 'progress' events for each stage, a 'sources' event once search completes,
+    'token' events as the plan is generated, then 'complete' (or 'error').
+    """
+    goal = request.args.get('goal', '').strip()
+
+    def events():
+        if not goal:
+            yield _sse('error', {'error': 'Please enter a goal.'})
+            return
+
+        yield _sse('progress', {'step': 'searching', 'message': 'Generating search queries...'})
+        days, plan, steps, sources, weather = _gather_plan_inputs(goal)
+        if plan is None and not steps:
+            yield _sse('error', {'error': 'Failed to break goal into steps.'})
+            return
+
+        yield _sse('sources', {'sources': [{'url': s['url'], 'search_query': s['search_query']} for s in sources]})
+        yield _sse('progress', {'step': 'generating', 'message': 'Generating your personalized plan...'})
+
+        if plan is None:
+            chunks = []
+            try:
+                for chunk in stream_plan(goal, steps, sources, weather, days):
+                    chunks.append(chunk)
+                    yield _sse('token', {'token': chunk})
+            except Exception as e:
+                yield _sse('error', {'error': f"Error generating response: {str(e)}"})
+                return
+            plan = finish_plan(goal, ''.join(chunks), days)
+
+        # The client reloads history on 'complete', so wait until this plan's row is committed
+        try:
+            store_plan(goal, plan, datetime.now().isoformat()).result(timeout=PLAN_SAVE_TIMEOUT)
+        except Exception:
+            yield _sse('error', {'error': 'Failed to save the generated plan.'})
+            return
+        yield _sse('complete', {'step': 'complete', 'plan': plan, 'days': days})
+
+    response = Response(stream_with_context(events()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
 @app.route('/history')
 def history():
     """
-    Endpoint to fetch history of plans.
+    Endpoint to fetch history of plans, newest first.
+    Supports pagination via ?limit= (default 50, max 200) and ?offset=.
+    The page is read up front, so the pooled connection is released before the
+    client-paced response; the JSON array is then streamed row by row.
     """
-    plans = get_all_plans()
-    return jsonify([{'goal': g, 'plan': p, 'timestamp': t} for g, p, t in plans])
+    limit = min(max(request.args.get('limit', 50, type=int), 1), 200)
+    offset = max(request.args.get('offset', 0, type=int), 0)
+    plans = get_all_plans(limit, offset)
+
+    def generate():
+        yield b'['
+        for i, (g, p, t) in enumerate(plans):
+            if i:
+                yield b','
+            yield orjson.dumps({'goal': g, 'plan': p, 'timestamp': t})
+        yield b']'
+
+    return Response(stream_with_context(generate()), mimetype='application/json')
 
 @app.route('/static/<path:filename>')
 def static_files(filename):
@@ -126,4 +233,5 @@ def static_files(filename):
     return send_from_directory('static', filename)
 
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
+    # Development server only; production runs under gunicorn via wsgi.py
+    app.run(debug=os.getenv('FLASK_DEBUG', '1') == '1', host='0.0.0.0', port=5000)
\ No newline at end of file
@@ -2,73 +2,353 @@
 """
 Database module for SQLite operations.
 Handles storage and retrieval of plans and queries.
+
+Connections are pooled: a single writer connection serialized by a lock,
+and a small pool of read-only connections that can run alongside it in WAL mode.
+Plan inserts are queued and written in batches by a background thread, so
+request handlers don't wait on the commit.
 """
 
 import sqlite3
 from datetime import datetime
+from contextlib import contextmanager
+from itertools import groupby
+import atexit
+import logging
 import os
+import queue
+import threading
+from concurrent.futures import Future
 
 DB_FILE = "task_plans.db"
+BUSY_TIMEOUT_MS = 5000
+READ_POOL_SIZE = os.cpu_count() or 4
+
+_write_conn = None
+_write_lock = threading.Lock()
+_read_pool = queue.Queue()
+_read_count = 0
+_read_count_lock = threading.Lock()
+_write_queue = queue.Queue()
+_writer_thread = None
+_writer_thread_lock = threading.Lock()
+
+logger = logging.getLogger(__name__)
+
+def _apply_pragmas(conn):
+    """
+    Apply per-connection PRAGMAs. The busy timeout makes connections wait
+    for the lock instead of failing with 'database is locked'.
+
+    Args:
+        conn (sqlite3.Connection): Connection to tune.
+    """
+    conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA cache_size=-20000")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA foreign_keys=ON")
+
+def _get_writer():
+    """
+    Return the shared writer connection, opening it on first use.
+    Must be called with _write_lock held.
+
+    Returns:
+        sqlite3.Connection: Writer connection in autocommit mode.
+    """
+    global _write_conn
+    if _write_conn is None:
+        _write_conn = sqlite3.connect(DB_FILE, check_same_thread=False, isolation_level=None)
+        _apply_pragmas(_write_conn)
+    return _write_conn
+
+def _execute_write(sql, params=(), many=False):
+    """
+    Run a write statement in its own transaction on the writer connection.
+    BEGIN IMMEDIATE takes the write lock up front so the transaction never
+    has to upgrade a read lock (and hit SQLITE_BUSY) halfway through.
+
+    Args:
+        sql (str): Statement to execute.
+        params (tuple or list): Statement parameters, or a list of parameter
+            tuples when many is True.
+        many (bool): Execute the statement once per parameter tuple.
+    """
+    with _write_lock:
+        conn = _get_writer()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if many:
+                conn.executemany(sql, params)
+            else:
+                conn.execute(sql, params)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+def _write_batch(batch):
+    """
+    Write a batch of queued statements in a single transaction, grouping
+    consecutive items for the same statement into one executemany call.
+
+    Args:
+        batch (list): List of tuples (sql, rows, future).
+    """
+    with _write_lock:
+        conn = _get_writer()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for sql, items in groupby(batch, key=lambda item: item[0]):
+                conn.executemany(sql, [params for _, rows, _ in items for params in rows])
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+def _writer_loop():
+    """
+    Background writer: block for the next queued write, then drain whatever
+    else is already queued and commit it all as one batch. Each item's future
+    is resolved once its batch has committed (or failed).
+    """
+    while True:
+        batch = [_write_queue.get()]
+        while True:
+            try:
+                batch.append(_write_queue.get_nowait())
+            except queue.Empty:
+                break
+        try:
+            _write_batch(batch)
+        except Exception as e:
+            logger.exception("Failed to write %d queued items", len(batch))
+            for _, _, future in batch:
+                future.set_exception(e)
+        else:
+            for _, _, future in batch:
+                future.set_result(None)
+        finally:
+            for _ in batch:
+                _write_queue.task_done()
+
+def _enqueue_write(sql, rows):
+    """
+    Queue a write for the background writer thread, starting it on first use.
+
+    Args:
+        sql (str): Statement to execute.
+        rows (list): Parameter tuples, written in the same transaction.
+
+    Returns:
+        Future: Resolved once the rows are committed; holds the exception if the write failed.
+    """
+    global _writer_thread
+    if _writer_thread is None:
+        with _writer_thread_lock:
+            if _writer_thread is None:
+                _writer_thread = threading.Thread(target=_writer_loop, name="db-writer", daemon=True)
+                _writer_thread.start()
+    future = Future()
+    _write_queue.put_nowait((sql, rows, future))
+    return future
+
+def flush_writes():
+    """
+    Block until every queued write has been committed.
+    Registered with atexit so pending writes aren't lost on shutdown.
+    """
+    if _writer_thread is not None:
+        _write_queue.join()
+
+atexit.register(flush_writes)
+
+@contextmanager
+def _reader():
+    """
+    Borrow a read-only connection from the pool, opening a new one while
+    the pool is below READ_POOL_SIZE, otherwise waiting for one to be returned.
+
+    Yields:
+        sqlite3.Connection: Read-only connection.
+    """
+    global _read_count
+    try:
+        conn = _read_pool.get_nowait()
+    except queue.Empty:
+        with _read_count_lock:
+            can_open = _read_count < READ_POOL_SIZE
+            if can_open:
+                _read_count += 1
+        if can_open:
+            try:
+                conn = sqlite3.connect(f"file:{DB_FILE}?mode=ro", uri=True, check_same_thread=False)
+                _apply_pragmas(conn)
+            except Exception:
+                with _read_count_lock:
+                    _read_count -= 1
+                raise
+        else:
+            conn = _read_pool.get()
+    try:
+        yield conn
+    finally:
+        _read_pool.put(conn)
 
 def init_db():
     """
-    Initialize the SQLite database with plans and queries tables.
-    """
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute('''CREATE TABLE IF NOT EXISTS plans
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                  goal TEXT,
-                  plan TEXT,
-                  timestamp TEXT)''')
-    c.execute('''CREATE TABLE IF NOT EXISTS queries
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                  query TEXT,
-                  results TEXT,
-                  timestamp TEXT)''')
-    conn.commit()
-    conn.close()
+    Initialize the SQLite database with plans, queries, llm_cache and geocode_cache tables.
+    Switches the database to WAL journaling so reads are not blocked by writes.
+    """
+    with _write_lock:
+        conn = _get_writer()
+        # WAL is persistent on the database file, so this only needs to run once.
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute('''CREATE TABLE IF NOT EXISTS plans
+                     (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                      goal TEXT,
+                      plan TEXT,
+                      timestamp TEXT)''')
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_plans_ts ON plans(timestamp DESC)")
+        conn.execute('''CREATE TABLE IF NOT EXISTS queries
+                     (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                      query TEXT,
+                      results TEXT,
+                      timestamp TEXT)''')
+        conn.execute('''CREATE TABLE IF NOT EXISTS llm_cache
+                     (key TEXT PRIMARY KEY,
+                      kind TEXT,
+                      embedding BLOB,
+                      response TEXT,
+                      timestamp TEXT)''')
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_kind_ts ON llm_cache(kind, timestamp DESC)")
+        conn.execute('''CREATE TABLE IF NOT EXISTS geocode_cache
+                     (city TEXT PRIMARY KEY,
+                      latitude REAL,
+                      longitude REAL)''')
 
 def store_plan(goal, plan, timestamp):
     """
-    Store a generated plan in the database.
-    
+    Queue a generated plan to be stored in the database.
+    The insert is committed by the background writer thread shortly after.
+
     Args:
         goal (str): User's goal.
         plan (str): Generated plan text.
         timestamp (str): ISO timestamp.
+
+    Returns:
+        Future: Resolved once this plan is committed, for callers that must
+        not report success before the row is visible.
     """
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute("INSERT INTO plans (goal, plan, timestamp) VALUES (?, ?, ?)", (goal, plan, timestamp))
-    conn.commit()
-    conn.close()
+    return _enqueue_write("INSERT INTO plans (goal, plan, timestamp) VALUES (?, ?, ?)", [(goal, plan, timestamp)])
 
 def store_query(query, results, timestamp):
     """
-    Store a search query and its results.
-    
+    Queue a search query and its results to be stored in the database.
+    The insert is committed by the background writer thread shortly after.
+
     Args:
         query (str): Search query.
         results (str): JSON string of results.
         timestamp (str): ISO timestamp.
     """
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute("INSERT INTO queries (query, results, timestamp) VALUES (?, ?, ?)", (query, results, timestamp))
-    conn.commit()
-    conn.close()
+    _enqueue_write("INSERT INTO queries (query, results, timestamp) VALUES (?, ?, ?)", [(query, results, timestamp)])
 
-def get_all_plans():
+def store_queries_bulk(rows):
+    """
+    Queue many search queries to be stored. They are queued as a single item,
+    so the background writer commits them in one transaction with one executemany.
+
+    Args:
+        rows (list): List of tuples (query, results, timestamp).
     """
-    Retrieve all plans ordered by timestamp descending.
-    
+    if rows:
+        _enqueue_write("INSERT INTO queries (query, results, timestamp) VALUES (?, ?, ?)", list(rows))
+
+def get_all_plans(limit=50, offset=0):
+    """
+    Retrieve a page of plans ordered by timestamp descending.
+
+    Args:
+        limit (int): Maximum number of plans to return.
+        offset (int): Number of newest plans to skip.
+
     Returns:
         list: List of tuples (goal, plan, timestamp).
     """
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute("SELECT goal, plan, timestamp FROM plans ORDER BY timestamp DESC")
-    plans = c.fetchall()
-    conn.close()
-    return plans
\ No newline at end of file
+    with _reader() as conn:
+        return conn.execute("SELECT goal, plan, timestamp FROM plans ORDER BY timestamp DESC LIMIT ? OFFSET ?",
+                            (limit, offset)).fetchall()
+
+def get_cached_response(key, since=None):
+    """
+    Look up a cached LLM response by key.
+
+    Args:
+        key (str): Cache key.
+        since (str, optional): ISO timestamp; older entries are ignored.
+
+    Returns:
+        str or None: Cached response text.
+    """
+    with _reader() as conn:
+        row = conn.execute("SELECT response FROM llm_cache WHERE key = ? AND timestamp >= ?",
+                           (key, since or '')).fetchone()
+    return row[0] if row else None
+
+def store_cached_response(key, response, timestamp, kind=None, embedding=None):
+    """
+    Store (or replace) a cached LLM response.
+
+    Args:
+        key (str): Cache key.
+        response (str): Response text.
+        timestamp (str): ISO timestamp.
+        kind (str, optional): Entry kind, used to group semantic lookups.
+        embedding (bytes, optional): Packed float32 embedding for semantic lookups.
+    """
+    _execute_write("INSERT OR REPLACE INTO llm_cache (key, kind, embedding, response, timestamp) VALUES (?, ?, ?, ?, ?)",
+                   (key, kind, embedding, response, timestamp))
+
+def get_recent_embeddings(kind, limit, since=None):
+    """
+    Retrieve the most recent embedded cache entries of a kind.
+
+    Args:
+        kind (str): Entry kind.
+        limit (int): Maximum number of rows.
+        since (str, optional): ISO timestamp; older entries are ignored.
+
+    Returns:
+        list: List of tuples (embedding, response).
+    """
+    with _reader() as conn:
+        return conn.execute("SELECT embedding, response FROM llm_cache WHERE kind = ? AND embedding IS NOT NULL "
+                            "AND timestamp >= ? ORDER BY timestamp DESC LIMIT ?", (kind, since or '', limit)).fetchall()
+
+def get_geocode(city):
+    """
+    Look up persisted coordinates for a city.
+
+    Args:
+        city (str): Normalized (stripped, lowercased) city name.
+
+    Returns:
+        tuple or None: (latitude, longitude).
+    """
+    with _reader() as conn:
+        return conn.execute("SELECT latitude, longitude FROM geocode_cache WHERE city = ?", (city,)).fetchone()
+
+def store_geocode(city, latitude, longitude):
+    """
+    Persist the coordinates of a city.
+
+    Args:
+        city (str): Normalized (stripped, lowercased) city name.
+        latitude (float): Latitude.
+        longitude (float): Longitude.
+    """
+    _execute_write("INSERT OR REPLACE INTO geocode_cache (city, latitude, longitude) VALUES (?, ?, ?)",
+                   (city, latitude, longitude))
\ No newline at end of file
@@ -0,0 +1,184 @@
+# llm_cache.py
+"""
+LLM response cache module.
+Short deterministic prompts are cached by an exact SHA-256 key, while goal-level
+outputs (plans, steps) are cached semantically by goal embedding so near-duplicate
+goals reuse a previous response instead of paying for another Gemini call.
+"""
+
+import hashlib
+import numpy as np
+from datetime import datetime, timedelta
+from functools import lru_cache
+from config import GEMINI_API_KEY
+import google.generativeai as genai
+from database import get_cached_response, store_cached_response, get_recent_embeddings
+
+genai.configure(api_key=GEMINI_API_KEY)
+
+MODEL_NAME = 'gemini-1.5-flash'
+EMBEDDING_MODEL = 'models/text-embedding-004'
+CACHE_TTL = timedelta(hours=24)
+
+@lru_cache(maxsize=256)
+def _embed_normalized(text):
+    """
+    Embed text with Gemini and normalize it to unit length, so cosine
+    similarity between two embeddings is just their dot product.
+    Errors propagate, so failed calls are not memoized.
+
+    Args:
+        text (str): Text to embed.
+
+    Returns:
+        ndarray: Unit-length float32 embedding.
+    """
+    values = np.asarray(genai.embed_content(model=EMBEDDING_MODEL, content=text)['embedding'], dtype=np.float32)
+    return values / (np.linalg.norm(values) or 1.0)
+
+def _embed(text):
+    """
+    Embed text, returning None if the embedding call fails.
+
+    Args:
+        text (str): Text to embed.
+
+    Returns:
+        ndarray or None: Unit-length float32 embedding.
+    """
+    try:
+        return _embed_normalized(text)
+    except Exception:
+        return None
+
+def _cache_key(*parts):
+    """
+    Build a stable SHA-256 cache key from the given parts.
+
+    Returns:
+        str: Hex digest.
+    """
+    return hashlib.sha256("\0".join(str(p) for p in parts).encode('utf-8')).hexdigest()
+
+class LLMCache:
+    """
+    Exact and semantic cache for Gemini responses, persisted in the llm_cache table.
+    Cache failures are never fatal: lookups degrade to a miss and stores are skipped.
+    """
+
+    def __init__(self, similarity_threshold=0.92, max_candidates=200, ttl=CACHE_TTL):
+        """
+        Args:
+            similarity_threshold (float): Minimum cosine similarity for a semantic hit.
+            max_candidates (int): Number of most recent entries compared on lookup.
+            ttl (timedelta): How long entries stay valid.
+        """
+        self.similarity_threshold = similarity_threshold
+        self.max_candidates = max_candidates
+        self.ttl = ttl
+
+    def _since(self):
+        """
+        Returns:
+            str: ISO timestamp of the oldest entry still within the TTL.
+        """
+        return (datetime.now() - self.ttl).isoformat()
+
+    def get(self, prompt, model=MODEL_NAME, temperature=None):
+        """
+        Return the cached response for an exact prompt.
+
+        Args:
+            prompt (str): Full prompt text.
+            model (str): Model name.
+            temperature (float, optional): Sampling temperature.
+
+        Returns:
+            str or None: Cached response.
+        """
+        try:
+            return get_cached_response(_cache_key(model, temperature, prompt), since=self._since())
+        except Exception:
+            return None
+
+    def set(self, prompt, response, model=MODEL_NAME, temperature=None):
+        """
+        Cache the response for an exact prompt.
+
+        Args:
+            prompt (str): Full prompt text.
+            response (str): Response text.
+            model (str): Model name.
+            temperature (float, optional): Sampling temperature.
+        """
+        try:
+            store_cached_response(_cache_key(model, temperature, prompt), response, datetime.now().isoformat())
+        except Exception:
+            pass
+
+    def get_similar(self, kind, goal):
+        """
+        Return the cached response of the given kind whose goal is most similar
+        to this one, if the similarity clears the threshold.
+
+        Args:
+            kind (str): Entry kind (e.g. 'steps', 'plan:3').
+            goal (str): User's goal.
+
+        Returns:
+            str or None: Cached response.
+        """
+        query = _embed(goal)
+        if query is None:
+            return None
+        try:
+            rows = get_recent_embeddings(kind, self.max_candidates, since=self._since())
+        except Exception:
+            return None
+        if not rows:
+            return None
+        try:
+            scores = np.vstack([np.frombuffer(blob, dtype=np.float32) for blob, _ in rows]) @ query
+        except ValueError:  # Embeddings of a different size (e.g. after a model change)
+            return None
+        best = int(np.argmax(scores))
+        return rows[best][1] if scores[best] >= self.similarity_threshold else None
+
+    def set_similar(self, kind, goal, response):
+        """
+        Cache a response under the goal's embedding.
+
+        Args:
+            kind (str): Entry kind.
+            goal (str): User's goal.
+            response (str): Response text.
+        """
+        embedding = _embed(goal)
+        if embedding is None:
+            return
+        try:
+            store_cached_response(_cache_key(MODEL_NAME, kind, goal), response, datetime.now().isoformat(),
+                                  kind=kind, embedding=embedding.tobytes())
+        except Exception:
+            pass
+
+response_cache = LLMCache()
+
+def cached_generate(model, prompt, **kwargs):
+    """
+    Return the model's text for a prompt, served from the exact-match cache when
+    possible. Only successful responses are cached; errors propagate to the caller.
+
+    Args:
+        model (GenerativeModel): Model to call on a cache miss.
+        prompt (str): Full prompt text.
+        **kwargs: Extra arguments for generate_content (e.g. generation_config).
+
+    Returns:
+        str: Response text.
+    """
+    text = response_cache.get(prompt)
+    if text is None:
+        text = model.generate_content(prompt, **kwargs).text
+        response_cache.set(prompt, text)
+    return text
\ No newline at end of file
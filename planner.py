@@ -6,14 +6,82 @@ using advanced, universal prompt engineering for ANY query type.
 
 import os
 import re
-from datetime import datetime, timedelta
+from datetime import datetime
+from functools import lru_cache
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from config import GEMINI_API_KEY
 import google.generativeai as genai
+from llm_cache import response_cache, cached_generate
+from database import get_geocode, store_geocode
 
 genai.configure(api_key=GEMINI_API_KEY)
 model = genai.GenerativeModel('gemini-1.5-flash')
 
+# Shared HTTP session so connections to Open-Meteo are kept alive between calls
+HTTP_TIMEOUT = 5
+_session = requests.Session()
+_session.mount('https://', HTTPAdapter(pool_connections=32, pool_maxsize=64,
+                                       max_retries=Retry(total=2, backoff_factor=0.2)))
+
+# Weather keywords, anchored at a word start so "rain"/"event" don't match "train"/"prevent"
+# while suffixes like "trips", "rainy" or "travelling" still do
+_WEATHER_RE = re.compile(r'\b(?:weather|forecast|climate|rain|temperature|trip|travel|outdoor|event)', re.IGNORECASE)
+
+# Post-processing patterns for generated plans
+_DAY_RE = re.compile(r'(Day \d+:)')
+_BULLET_RE = re.compile(r'(- |• )')
+_STEP_RE = re.compile(r'(Step \d+:)')
+
+# Simplified descriptions of WMO weather codes
+_WEATHERCODE_DESC = {
+    0: "Clear sky ☀️",
+    1: "Mainly clear 🌤️",
+    2: "Partly cloudy ⛅",
+    3: "Overcast ☁️",
+    61: "Light rain 🌦️",
+    63: "Moderate rain 🌧️",
+    80: "Rain showers 🌦️"
+}
+
+# Static instructions shared by every plan request. They are sent as the system
+# instruction, so only the per-request goal, steps, sources and weather vary.
+PLAN_SYSTEM_PROMPT = """You are a creative, fun Task Planning Agent. Based on the user's goal, create a tailored, universal response for ANY query type (travel, learning, tasks, etc.).
+
+Universal Guidelines (apply to ALL responses):
+- Tailor perfectly to the query:
+  - **Travel/Events/Plans with locations**: Create a detailed, realistic day-by-day itinerary for the requested number of days/periods. Assign activities logically. Use fun, engaging language with emojis and motivational tips.
+  - **Learning/Courses/Videos/Tasks**: Provide a step-by-step guide framed as an exciting adventure. Highlight best resources (e.g., videos, courses) with clickable Markdown links [Resource Name](direct_URL_from_sources).
+  - **General/Other**: Deliver an engaging, structured response with relevant details and links, tailored to the goal.
+- **Linking**:
+  - For locations/restaurants/businesses (if relevant): Link names to Google business pages using [Place Name](https://www.google.com/search?q=Place+Name+location).
+  - For learning resources/videos/courses: Use direct URLs from sources as [Resource Name](direct_URL).
+  - Ensure ALL mentioned places/businesses are linked to Google searches.
+- **No locations if irrelevant**: Omit locations entirely if the goal doesn't involve them (e.g., learning, abstract tasks).
+- **No images**: Do not include image placeholders or references.
+- Use provided sources for specifics/links/resources (assume current/sufficient). Do not say you need more data.
+- Structure:
+  - Plans: 📅 Day 1: Fun overview... then ✅ bullet points with emojis/links.
+  - Learning/Tasks: 🎯 Step 1: Fun description... with emojis/links.
+  - General: Logical sections with emojis/links.
+- Use emojis for visual appeal. Output clean Markdown."""
+
+# Per-request tail of the plan prompt, filled in by _build_plan_prompt
+PLAN_REQUEST_TEMPLATE = """User's goal: '{goal}'
+Number of days/periods: {days}
+
+Actionable steps: {steps}
+Sources (use for specifics, direct links, Google links for places): {sources}
+{weather}
+
+Generate the response now!"""
+
+# Plan model with the static instructions as its system instruction. The prompt is far
+# below the minimum size for explicit context caching, so no CachedContent is created.
+plan_model = genai.GenerativeModel('gemini-1.5-flash', system_instruction=PLAN_SYSTEM_PROMPT)
+
 def needs_weather(goal):
     """
     Heuristic to check if goal requires weather info.
@@ -24,8 +92,66 @@ def needs_weather(goal):
     Returns:
         bool: True if weather needed.
     """
-    weather_keywords = ["weather", "forecast", "climate", "rain", "temperature", "trip", "travel", "outdoor", "event"]
-    return any(word in goal.lower() for word in weather_keywords)
+    return bool(_WEATHER_RE.search(goal))
+
+@lru_cache(maxsize=1024)
+def _geocode(city):
+    """
+    Resolve a city name to coordinates with Open-Meteo's geocoding API.
+    Cached in memory and persisted in SQLite, since a city's coordinates don't
+    change; HTTP failures raise instead of returning None so they are not cached.
+
+    Args:
+        city (str): City name.
+
+    Returns:
+        tuple or None: (latitude, longitude), or None if the city is unknown.
+    """
+    key = city.strip().lower()
+    try:
+        row = get_geocode(key)
+    except Exception:
+        row = None
+    if row:
+        return tuple(row)
+
+    geocode_response = _session.get("https://geocoding-api.open-meteo.com/v1/search",
+                                    params={'name': city, 'count': 1, 'language': 'en', 'format': 'json'},
+                                    timeout=HTTP_TIMEOUT)
+    geocode_response.raise_for_status()
+    results = orjson.loads(geocode_response.content).get('results')
+    if not results:
+        return None
+    coords = (results[0]['latitude'], results[0]['longitude'])
+    try:
+        store_geocode(key, *coords)
+    except Exception:
+        pass
+    return coords
+
+@lru_cache(maxsize=64)
+def _forecast(latitude, longitude, days, today):
+    """
+    Fetch the daily forecast for a location. Cached per calendar day (the
+    today argument is only part of the cache key), so repeat lookups for the
+    same place reuse the response until the date changes.
+
+    Args:
+        latitude (float): Latitude.
+        longitude (float): Longitude.
+        days (int): Number of days.
+        today (str): Current date as YYYY-MM-DD.
+
+    Returns:
+        dict: Open-Meteo 'daily' block.
+    """
+    response = _session.get("https://api.open-meteo.com/v1/forecast",
+                            params={'latitude': latitude, 'longitude': longitude,
+                                    'daily': 'temperature_2m_max,temperature_2m_min,weathercode',
+                                    'timezone': 'auto', 'forecast_days': days},
+                            timeout=HTTP_TIMEOUT)
+    response.raise_for_status()
+    return orjson.loads(response.content)['daily']
 
 def get_weather(city, days=7):
     """
@@ -39,56 +165,48 @@ def get_weather(city, days=7):
         str or None: Formatted forecast.
     """
     try:
-        geocode_url = f"https://geocoding-api.open-meteo.com/v1/search?name={city}&count=1&language=en&format=json"
-        geocode_response = requests.get(geocode_url)
-        if geocode_response.status_code != 200 or not geocode_response.json().get('results'):
-            return None
-        coords = geocode_response.json()['results'][0]
-        latitude = coords['latitude']
-        longitude = coords['longitude']
-
-        weather_url = f"https://api.open-meteo.com/v1/forecast?latitude={latitude}&longitude={longitude}&daily=temperature_2m_max,temperature_2m_min,weathercode&timezone=auto&forecast_days={days}"
-        response = requests.get(weather_url)
-        if response.status_code == 200:
-            data = response.json()['daily']
-            forecast = []
-            for i in range(days):
-                date = (datetime.now() + timedelta(days=i)).strftime('%Y-%m-%d')
-                max_temp = data['temperature_2m_max'][i]
-                min_temp = data['temperature_2m_min'][i]
-                weather_code = data['weathercode'][i]
-                weather_desc = {
-                    0: "Clear sky ☀️",
-                    1: "Mainly clear 🌤️",
-                    2: "Partly cloudy ⛅",
-                    3: "Overcast ☁️",
-                    61: "Light rain 🌦️",
-                    63: "Moderate rain 🌧️",
-                    80: "Rain showers 🌦️"
-                }.get(weather_code, "Unknown ❓")
-                forecast.append(f"{date}: {min_temp}°C to {max_temp}°C, {weather_desc}")
-            return "\n".join(forecast)
-        else:
+        coords = _geocode(city)
+        if coords is None:
             return None
+        latitude, longitude = coords
+
+        data = _forecast(latitude, longitude, days, datetime.now().strftime('%Y-%m-%d'))
+        # Open-Meteo already returns YYYY-MM-DD dates, one entry per requested day
+        dates, max_temps, min_temps, codes = (data['time'], data['temperature_2m_max'],
+                                              data['temperature_2m_min'], data['weathercode'])
+        return "\n".join(f"{date}: {min_temp}°C to {max_temp}°C, {_WEATHERCODE_DESC.get(code, 'Unknown ❓')}"
+                         for date, max_temp, min_temp, code in zip(dates[:days], max_temps, min_temps, codes))
     except Exception:
         return None
 
-def extract_num_days(goal):
+def extract_meta(goal):
     """
-    Extract number of days/periods from goal. Defaults to 1 for non-plan queries.
-    
+    Extract the day count, main city and weather relevance of a goal in a single
+    Gemini call (JSON structured output) instead of one call per field.
+
     Args:
         goal (str): User's goal.
-    
+
     Returns:
-        int: Number of days/periods.
+        dict: {'days': int, 'city': str or None, 'needs_weather': bool}.
     """
-    prompt = f"Extract the number of days/periods for the plan or guide from this goal: '{goal}'. If not specified, unclear, or not applicable (e.g., single task/learning), default to 1. Output only the integer number."
+    prompt = f"""Analyze this goal: '''{goal}'''
+Return a JSON object with these keys:
+- "days": the number of days/periods for the plan or guide as an integer. If not specified, unclear, or not applicable (e.g., single task/learning), use 1.
+- "city": the main city the goal is about as a string, or null if there is none.
+- "needs_weather": true if a weather forecast would help with this goal (e.g., trips, travel, outdoor activities, events), otherwise false.
+Output ONLY JSON."""
     try:
-        response = model.generate_content(prompt)
-        return max(1, int(response.text.strip()))
+        text = cached_generate(model, prompt, generation_config={'response_mime_type': 'application/json'})
+        data = orjson.loads(text)
+        city = data.get('city')
+        return {
+            'days': max(1, int(data.get('days') or 1)),
+            'city': (city.strip() or None) if isinstance(city, str) else None,
+            'needs_weather': bool(data.get('needs_weather')),
+        }
     except Exception:
-        return 1
+        return {'days': 1, 'city': None, 'needs_weather': needs_weather(goal)}
 
 def break_into_steps(goal):
     """
@@ -100,13 +218,99 @@ def break_into_steps(goal):
     Returns:
         list: List of steps.
     """
+    cached = response_cache.get_similar('steps', goal)
+    if cached is not None:
+        return cached.split('\n')
+
     prompt = f"Break the following goal into 5-10 actionable, fun, and easy-to-understand steps: '{goal}'. Make them creative, engaging, and suitable for ANY goal (travel, learning, tasks, etc.)."
     try:
         response = model.generate_content(prompt)
         steps = response.text.split('\n')
-        return [step.strip() for step in steps if step.strip()]
+        steps = [step.strip() for step in steps if step.strip()]
     except Exception:
         return []
+    if steps:
+        response_cache.set_similar('steps', goal, '\n'.join(steps))
+    return steps
+
+def _build_plan_prompt(goal, steps, sources, weather, days):
+    """
+    Build the per-request part of the plan prompt (the static guidelines are
+    sent separately as PLAN_SYSTEM_PROMPT).
+
+    Args:
+        goal (str): User's goal.
+        steps (list): Actionable steps.
+        sources (list): Extracted sources.
+        weather (str or None): Weather forecast.
+        days (int): Number of days/periods.
+
+    Returns:
+        str: Prompt text.
+    """
+    sources_text = "\n\n".join([f"Source from '{s['search_query']}': {s['url']}\n{s['content']}" for s in sources])
+    weather_text = f"Weather forecast:\n{weather}" if weather else ""
+
+    return PLAN_REQUEST_TEMPLATE.format(
+        goal=goal,
+        days=days,
+        steps=', '.join(steps),
+        sources=sources_text,
+        weather=weather_text,
+    )
+
+def get_cached_plan(goal, days=1):
+    """
+    Return a previously generated plan for a near-identical goal, if any.
+    Plans are only reused for the same number of days.
+
+    Args:
+        goal (str): User's goal.
+        days (int): Number of days/periods.
+
+    Returns:
+        str or None: Cached plan.
+    """
+    return response_cache.get_similar(f"plan:{days}", goal)
+
+def finish_plan(goal, raw_plan, days=1):
+    """
+    Post-process raw model output into the final plan and cache it.
+
+    Args:
+        goal (str): User's goal.
+        raw_plan (str): Model output.
+        days (int): Number of days/periods.
+
+    Returns:
+        str: Final plan in markdown.
+    """
+    # Auto-enhance with emojis if missing
+    plan = _DAY_RE.sub(r'📅 \1', raw_plan)
+    plan = _BULLET_RE.sub(r'✅ \1', plan)
+    plan = _STEP_RE.sub(r'🎯 \1', plan)
+    response_cache.set_similar(f"plan:{days}", goal, plan)
+    return plan
+
+def stream_plan(goal, steps, sources, weather=None, days=1):
+    """
+    Stream the raw plan text from Gemini as it is generated.
+    Pass the concatenated chunks to finish_plan once the stream ends.
+
+    Args:
+        goal (str): User's goal.
+        steps (list): Actionable steps.
+        sources (list): Extracted sources.
+        weather (str, optional): Weather forecast.
+        days (int): Number of days/periods.
+
+    Yields:
+        str: Text chunks.
+    """
+    prompt = _build_plan_prompt(goal, steps, sources, weather, days)
+    for chunk in plan_model.generate_content(prompt, stream=True):
+        if chunk.text:
+            yield chunk.text
 
 def generate_plan(goal, steps, sources, weather=None, days=1):
     """
@@ -123,42 +327,8 @@ def generate_plan(goal, steps, sources, weather=None, days=1):
     Returns:
         str: Generated response in markdown.
     """
-    sources_text = "\n\n".join([f"Source from '{s['search_query']}': {s['url']}\n{s['content']}" for s in sources])
-    weather_text = f"Weather forecast:\n{weather}" if weather else ""
-    
-    universal_prompt = f"""You are a creative, fun Task Planning Agent. Based on the user's goal: '{goal}', create a tailored, universal response for ANY query type (travel, learning, tasks, etc.).
-
-Universal Guidelines (apply to ALL responses):
-- Tailor perfectly to the query:
-  - **Travel/Events/Plans with locations**: Create a detailed, realistic day-by-day itinerary for {days} days/periods. Assign activities logically. Use fun, engaging language with emojis and motivational tips.
-  - **Learning/Courses/Videos/Tasks**: Provide a step-by-step guide framed as an exciting adventure. Highlight best resources (e.g., videos, courses) with clickable Markdown links [Resource Name](direct_URL_from_sources).
-  - **General/Other**: Deliver an engaging, structured response with relevant details and links, tailored to the goal.
-- **Linking**:
-  - For locations/restaurants/businesses (if relevant): Link names to Google business pages using [Place Name](https://www.google.com/search?q=Place+Name+location).
-  - For learning resources/videos/courses: Use direct URLs from sources as [Resource Name](direct_URL).
-  - Ensure ALL mentioned places/businesses are linked to Google searches.
-- **No locations if irrelevant**: Omit locations entirely if the goal doesn't involve them (e.g., learning, abstract tasks).
-- **No images**: Do not include image placeholders or references.
-- Use provided sources for specifics/links/resources (assume current/sufficient). Do not say you need more data.
-- Structure:
-  - Plans: 📅 Day 1: Fun overview... then ✅ bullet points with emojis/links.
-  - Learning/Tasks: 🎯 Step 1: Fun description... with emojis/links.
-  - General: Logical sections with emojis/links.
-- Use emojis for visual appeal. Output clean Markdown.
-
-Actionable steps: {', '.join(steps)}
-Sources (use for specifics, direct links, Google links for places): {sources_text}
-{weather_text if needs_weather(goal) else ''}
-
-Generate the response now!"""
-    
     try:
-        response = model.generate_content(universal_prompt)
-        plan = response.text
-        # Auto-enhance with emojis if missing
-        plan = re.sub(r'(Day \d+:)', r'📅 \1', plan)
-        plan = re.sub(r'(- |• )', r'✅ \1', plan)
-        plan = re.sub(r'(Step \d+:)', r'🎯 \1', plan)
-        return plan
+        response = plan_model.generate_content(_build_plan_prompt(goal, steps, sources, weather, days))
+        return finish_plan(goal, response.text, days)
     except Exception as e:
         return f"Error generating response: {str(e)}"
\ No newline at end of file
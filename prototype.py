@@ -1,32 +1,109 @@
 import streamlit as st
 import sqlite3
-import os
-import requests
+import io
+import json
+import hashlib
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+import httpx
 from tavily import TavilyClient
 import trafilatura
 from readability import Document
 from pypdf import PdfReader
 import google.generativeai as genai
 from datetime import datetime, timedelta
+from functools import lru_cache
+import numpy as np
+from sklearn.feature_extraction.text import TfidfVectorizer
 import re
 
 # Placeholders for API keys - replace with actual keys
 GEMINI_API_KEY=""
 TAVILY_API_KEY=""
 
+MODEL_NAME = 'gemini-1.5-flash'
+
+# API clients are created once per process, not on every Streamlit rerun
 # Configure Gemini
-genai.configure(api_key=GEMINI_API_KEY)
-model = genai.GenerativeModel('gemini-1.5-flash')  # Free tier model
+@st.cache_resource
+def get_model():
+    genai.configure(api_key=GEMINI_API_KEY)
+    return genai.GenerativeModel(MODEL_NAME)  # Free tier model
+
+model = get_model()
 
 # Tavily client
-tavily = TavilyClient(api_key=TAVILY_API_KEY)
+@st.cache_resource
+def get_tavily():
+    return TavilyClient(api_key=TAVILY_API_KEY)
+
+tavily = get_tavily()
+
+# Shared HTTP client for weather and page fetches: keeps connections alive and
+# multiplexes concurrent requests to the same host over HTTP/2.
+# Created once per process (not on every Streamlit rerun); httpx.Client is thread-safe.
+@st.cache_resource
+def get_http_client():
+    return httpx.Client(http2=True, timeout=10.0, follow_redirects=True,
+                        limits=httpx.Limits(max_connections=20, max_keepalive_connections=20))
+
+http = get_http_client()
 
 # Database setup
 DB_FILE = "task_plans.db"
+BUSY_TIMEOUT_MS = 5000
+
+READ_POOL_SIZE = 4
+
+# Open a connection in autocommit mode with the busy timeout applied,
+# so writers wait for the lock instead of failing with 'database is locked'
+def _connect():
+    conn = sqlite3.connect(DB_FILE, isolation_level=None, check_same_thread=False)
+    conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+# Shared connections: one writer serialized by a lock, plus a small pool of readers.
+# Readers are pooled rather than kept per thread because Streamlit starts a new
+# thread for every script rerun, which would leak a connection each time.
+class DBPool:
+    def __init__(self, size=READ_POOL_SIZE):
+        self._writer = _connect()
+        self._writer_lock = threading.Lock()
+        self._readers = queue.Queue()
+        for _ in range(size):
+            self._readers.put(_connect())
+
+    @contextmanager
+    def writer(self):
+        with self._writer_lock:
+            try:
+                yield self._writer
+            except Exception:
+                if self._writer.in_transaction:
+                    self._writer.execute("ROLLBACK")
+                raise
+
+    @contextmanager
+    def reader(self):
+        conn = self._readers.get()
+        try:
+            yield conn
+        finally:
+            self._readers.put(conn)
 
 def init_db():
     conn = sqlite3.connect(DB_FILE)
     c = conn.cursor()
+    # WAL lets reads run alongside writes and is persistent on the database file
+    c.execute("PRAGMA journal_mode=WAL")
+    c.execute("PRAGMA synchronous=NORMAL")
+    c.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+    c.execute("PRAGMA cache_size=-20000")
+    c.execute("PRAGMA temp_store=MEMORY")
     c.execute('''CREATE TABLE IF NOT EXISTS plans
                  (id INTEGER PRIMARY KEY AUTOINCREMENT,
                   goal TEXT,
@@ -36,52 +113,135 @@ def init_db():
                  (id INTEGER PRIMARY KEY AUTOINCREMENT,
                   query TEXT,
                   results TEXT,
-                  timestamp TEXT)''')  # Changed to TEXT for timestamp
+                  timestamp TEXT)''')  # results: compact JSON, same format as database.py
+    c.execute("CREATE INDEX IF NOT EXISTS idx_plans_ts ON plans(timestamp DESC)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_queries_ts ON queries(timestamp DESC)")
+    # Same schema as database.py, since the Flask app shares this database file
+    c.execute('''CREATE TABLE IF NOT EXISTS llm_cache
+                 (key TEXT PRIMARY KEY,
+                  kind TEXT,
+                  embedding BLOB,
+                  response TEXT,
+                  timestamp TEXT)''')
+    c.execute('''CREATE TABLE IF NOT EXISTS plan_embeddings
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  goal TEXT,
+                  days INTEGER,
+                  embedding BLOB,
+                  plan TEXT,
+                  timestamp TEXT)''')
+    c.execute('''CREATE TABLE IF NOT EXISTS geocode_cache
+                 (city TEXT PRIMARY KEY,
+                  latitude REAL,
+                  longitude REAL)''')
     conn.commit()
     conn.close()
 
-init_db()
+# Created once per process (not on every Streamlit rerun), after the schema is set up
+@st.cache_resource
+def get_db_pool():
+    init_db()
+    return DBPool()
+
+pool = get_db_pool()
+
+# Gemini responses are cached on disk by SHA-256 of (model, prompt), so reruns and
+# repeated goals skip the API call; entries older than the TTL are regenerated.
+# Errors are not cached, and a cache failure just falls through to the API.
+LLM_CACHE_TTL = timedelta(hours=24)
+
+# One model per system instruction, created once per process
+@st.cache_resource
+def get_instructed_model(system_instruction):
+    return genai.GenerativeModel(MODEL_NAME, system_instruction=system_instruction)
+
+def cached_generate(prompt, system_instruction=None):
+    parts = [MODEL_NAME, prompt] if system_instruction is None else [MODEL_NAME, system_instruction, prompt]
+    key = hashlib.sha256("\0".join(parts).encode('utf-8')).hexdigest()
+    since = (datetime.now() - LLM_CACHE_TTL).isoformat()
+    try:
+        with pool.reader() as c:
+            row = c.execute("SELECT response FROM llm_cache WHERE key = ? AND timestamp >= ?", (key, since)).fetchone()
+        if row:
+            return row[0]
+    except sqlite3.Error:
+        pass
+    llm = model if system_instruction is None else get_instructed_model(system_instruction)
+    text = llm.generate_content(prompt).text
+    try:
+        with pool.writer() as c:
+            c.execute("BEGIN IMMEDIATE")
+            c.execute("INSERT OR REPLACE INTO llm_cache (key, response, timestamp) VALUES (?, ?, ?)",
+                      (key, text, datetime.now().isoformat()))
+            c.execute("COMMIT")
+    except sqlite3.Error:
+        pass
+    return text
+
+# Weather keywords in one precompiled pattern, anchored at a word start so "rain" doesn't
+# match "train" while suffixes like "trips" or "rainy" still do
+_WEATHER_RE = re.compile(r'\b(?:weather|forecast|climate|rain|temperature|trip|travel|outdoor)', re.IGNORECASE)
+
+# Post-processing patterns for generated plans
+_DAY_RE = re.compile(r'(Day \d+:)')
+_BULLET_RE = re.compile(r'(- |• )')
 
 # Function to check if goal requires weather info (simple heuristic)
 def needs_weather(goal):
-    weather_keywords = ["weather", "forecast", "climate", "rain", "temperature", "trip", "travel", "outdoor"]
-    return any(word in goal.lower() for word in weather_keywords)
+    return bool(_WEATHER_RE.search(goal))
+
+# City coordinates don't change, so geocoding results are memoized in-process and
+# persisted in SQLite for reuse across processes. HTTP failures raise instead of
+# returning None so they are not cached.
+@lru_cache(maxsize=512)
+def _geocode(city):
+    key = city.strip().lower()
+    with pool.reader() as c:
+        row = c.execute("SELECT latitude, longitude FROM geocode_cache WHERE city = ?", (key,)).fetchone()
+    if row:
+        return row
+    geocode_response = http.get("https://geocoding-api.open-meteo.com/v1/search",
+                                params={'name': city, 'count': 1, 'language': 'en', 'format': 'json'})
+    geocode_response.raise_for_status()
+    results = geocode_response.json().get('results')
+    if not results:
+        return None
+    coords = (results[0]['latitude'], results[0]['longitude'])
+    with pool.writer() as c:
+        c.execute("BEGIN IMMEDIATE")
+        c.execute("INSERT OR REPLACE INTO geocode_cache (city, latitude, longitude) VALUES (?, ?, ?)", (key, *coords))
+        c.execute("COMMIT")
+    return coords
+
+# Simplified weather descriptions (based on WMO weather codes)
+_WMO_DESC = {
+    0: "Clear sky",
+    1: "Mainly clear",
+    2: "Partly cloudy",
+    3: "Overcast",
+    61: "Light rain",
+    63: "Moderate rain",
+    80: "Rain showers"
+}
 
 # Function to get weather forecast (using Open-Meteo)
 def get_weather(city, days=7):
     try:
-        # Step 1: Get coordinates for the city using Open-Meteo's geocoding API
-        geocode_url = f"https://geocoding-api.open-meteo.com/v1/search?name={city}&count=1&language=en&format=json"
-        geocode_response = requests.get(geocode_url)
-        if geocode_response.status_code != 200 or not geocode_response.json().get('results'):
+        # Step 1: Get coordinates for the city
+        coords = _geocode(city)
+        if not coords:
             return None
-        coords = geocode_response.json()['results'][0]
-        latitude = coords['latitude']
-        longitude = coords['longitude']
+        latitude, longitude = coords
 
         # Step 2: Get weather forecast
         weather_url = f"https://api.open-meteo.com/v1/forecast?latitude={latitude}&longitude={longitude}&daily=temperature_2m_max,temperature_2m_min,weathercode&timezone=auto&forecast_days={days}"
-        response = requests.get(weather_url)
+        response = http.get(weather_url)
         if response.status_code == 200:
             data = response.json()['daily']
-            forecast = []
-            for i in range(days):
-                date = (datetime.now() + timedelta(days=i)).strftime('%Y-%m-%d')
-                max_temp = data['temperature_2m_max'][i]
-                min_temp = data['temperature_2m_min'][i]
-                weather_code = data['weathercode'][i]
-                # Simplified weather description (based on WMO weather codes)
-                weather_desc = {
-                    0: "Clear sky",
-                    1: "Mainly clear",
-                    2: "Partly cloudy",
-                    3: "Overcast",
-                    61: "Light rain",
-                    63: "Moderate rain",
-                    80: "Rain showers"
-                }.get(weather_code, "Unknown")
-                forecast.append(f"{date}: {min_temp}°C to {max_temp}°C, {weather_desc}")
-            return "\n".join(forecast)
+            base = datetime.now()
+            max_temps, min_temps, codes = data['temperature_2m_max'], data['temperature_2m_min'], data['weathercode']
+            return "\n".join(f"{(base + timedelta(days=i)).strftime('%Y-%m-%d')}: {min_temps[i]}°C to {max_temps[i]}°C, "
+                             f"{_WMO_DESC.get(codes[i], 'Unknown')}" for i in range(days))
         else:
             return None
     except Exception as e:
@@ -91,8 +251,7 @@ def get_weather(city, days=7):
 def extract_num_days(goal):
     prompt = f"Extract the number of days for the plan from this goal: '{goal}'. If not specified or unclear, default to 7. Output only the integer number."
     try:
-        response = model.generate_content(prompt)
-        num_days = int(response.text.strip())
+        num_days = int(cached_generate(prompt).strip())
         return max(1, num_days)  # At least 1 day
     except Exception as e:
         return 7
@@ -101,31 +260,74 @@ def extract_num_days(goal):
 def generate_search_queries(goal):
     prompt = f"From the general goal '{goal}', suggest 3 specific, targeted search queries for finding relevant sources (e.g., locations, details, itineraries, tips). Make them versatile for any type of goal. Output as a numbered list, one per line."
     try:
-        response = model.generate_content(prompt)
-        queries = [q.strip() for q in response.text.split('\n') if q.strip() and q[0].isdigit()]
+        queries = [q.strip() for q in cached_generate(prompt).split('\n') if q.strip() and q[0].isdigit()]
         return [q.split('.', 1)[1].strip() for q in queries[:3]]  # Extract after number.
     except Exception as e:
         # Universal fallback to generic
         return [goal, f"best tips for {goal}", f"detailed guide for {goal}"]
 
+# Static extraction instructions, sent as the system instruction so every extraction
+# request shares an identical prefix and only the query and page text vary.
+# The prefix is far below the minimum size for an explicit CachedContent, so this
+# relies on Gemini's implicit prefix caching instead.
+EXTRACT_INSTRUCTION = ("Extract only the most relevant information from the text the user sends, related to the given query. "
+                       "Focus on names of locations/places, addresses, Google Maps links, opening hours, descriptions, "
+                       "images URLs if available. Be concise, output only key points, no more than 500 words.")
+
+# Local relevance extraction: paragraphs are ranked against the query with TF-IDF and the
+# best ones kept (in document order) up to the word budget. Gemini is only used for pages
+# where nothing scores well, unless LLM_FALLBACK is switched off.
+LLM_FALLBACK = True
+MIN_RELEVANCE_SCORE = 0.1
+MAX_EXTRACT_WORDS = 500
+
+def rank_paragraphs(text, query):
+    paragraphs = [p.strip() for p in text.split('\n') if p.strip()]
+    if not paragraphs:
+        return None, 0.0
+    try:
+        matrix = TfidfVectorizer().fit_transform(paragraphs + [query])
+    except ValueError:  # Empty vocabulary (e.g. only punctuation)
+        return None, 0.0
+    # Rows are L2-normalized, so the dot product is the cosine similarity
+    scores = (matrix[:-1] @ matrix[-1].T).toarray().ravel()
+    selected, words = [], 0
+    for i in np.argsort(scores)[::-1]:
+        if scores[i] <= 0:
+            break
+        n = len(paragraphs[i].split())
+        if words + n > MAX_EXTRACT_WORDS:
+            continue
+        selected.append(i)
+        words += n
+    if not selected:
+        return None, float(scores.max())
+    return "\n".join(paragraphs[i] for i in sorted(selected)), float(scores.max())
+
+PDF_TEXT_LIMIT = 12000
+
 # Function to extract relevant content from URL
 def extract_relevant_content(url, query):
     try:
-        response = requests.get(url, timeout=10)
+        response = http.get(url)
         if response.status_code != 200:
             return None
         
         content_type = response.headers.get('Content-Type', '').lower()
         
         if 'pdf' in content_type or url.endswith('.pdf'):
-            # Handle PDF
-            with open('temp.pdf', 'wb') as f:
-                f.write(response.content)
-            reader = PdfReader('temp.pdf')
-            text = ""
+            # Handle PDF, parsed in memory rather than through a temp file
+            # Only the first ~12k characters are used downstream, so stop reading pages once collected
+            reader = PdfReader(io.BytesIO(response.content))
+            parts = []
+            total = 0
             for page in reader.pages:
-                text += page.extract_text() + "\n"
-            os.remove('temp.pdf')
+                page_text = page.extract_text() or ""
+                parts.append(page_text)
+                total += len(page_text)
+                if total >= PDF_TEXT_LIMIT:
+                    break
+            text = "\n".join(parts)
         else:
             # Handle HTML
             doc = Document(response.text)
@@ -135,11 +337,16 @@ def extract_relevant_content(url, query):
         if not text:
             return None
         
-        # Advanced strategy: Use Gemini to extract only relevant parts to avoid overload
-        prompt = f"Extract only the most relevant information from the following text related to '{query}'. Focus on names of locations/places, addresses, Google Maps links, opening hours, descriptions, images URLs if available. Be concise, output only key points, no more than 500 words:\n\n{text[:10000]}"  # Limit input to avoid 429
+        relevant_text, score = rank_paragraphs(text, query)
+        if relevant_text and (score >= MIN_RELEVANCE_SCORE or not LLM_FALLBACK):
+            return relevant_text
+        if not LLM_FALLBACK:
+            return text[:2000]
+        
+        # Low-confidence page: use Gemini to extract only relevant parts to avoid overload
+        prompt = f"Query: '{query}'\n\nText:\n{text[:10000]}"  # Limit input to avoid 429
         try:
-            response = model.generate_content(prompt)
-            relevant_text = response.text
+            relevant_text = cached_generate(prompt, EXTRACT_INSTRUCTION)
         except Exception as e:
             relevant_text = text[:2000]  # Fallback to truncated text
         
@@ -147,43 +354,80 @@ def extract_relevant_content(url, query):
     except Exception as e:
         return None
 
+# Extract one search result, falling back to an alternative URL if extraction fails
+def extract_source(url, sq, goal, spares=None):
+    content = extract_relevant_content(url, goal)
+    if content:
+        return {'url': url, 'content': content, 'search_query': sq}
+    # If failed, try the query's remaining search results before a new Tavily search
+    # (the deque is shared by the query's workers; popleft is atomic)
+    while spares:
+        try:
+            spare_url = spares.popleft()
+        except IndexError:
+            break
+        spare_content = extract_relevant_content(spare_url, goal)
+        if spare_content:
+            return {'url': spare_url, 'content': spare_content, 'search_query': sq}
+    # Only once those are exhausted, search for an alternative URL
+    alt_search = tavily.search(query=f"alternative site for {sq}", max_results=1)
+    if alt_search['results']:
+        alt_url = alt_search['results'][0]['url']
+        alt_content = extract_relevant_content(alt_url, goal)
+        if alt_content:
+            return {'url': alt_url, 'content': alt_content, 'search_query': sq}
+    return None
+
 # Function to search and extract sources with refined queries
+# Searches run concurrently, then all result URLs are fetched and extracted in parallel
 def find_and_extract_sources(goal, num_sources=3):
     sources = []
+    pending = []  # Query rows, stored together once the search is done
     search_queries = generate_search_queries(goal)
+    max_sources = num_sources * len(search_queries)  # Limit total sources
+    executor = ThreadPoolExecutor(max_workers=8)
     try:
-        for sq in search_queries:
-            search_results = tavily.search(query=sq, max_results=num_sources)
-            store_query(sq, str(search_results))  # Store each query and results
-            
-            for result in search_results['results']:
-                url = result['url']
-                content = extract_relevant_content(url, goal)
-                if content:
-                    sources.append({'url': url, 'content': content, 'search_query': sq})
-                else:
-                    # If failed, try to find alternative URL
-                    alt_search = tavily.search(query=f"alternative site for {sq}", max_results=1)
-                    if alt_search['results']:
-                        alt_url = alt_search['results'][0]['url']
-                        alt_content = extract_relevant_content(alt_url, goal)
-                        if alt_content:
-                            sources.append({'url': alt_url, 'content': alt_content, 'search_query': sq})
-                if len(sources) >= num_sources * len(search_queries):  # Limit total sources
-                    break
-            if len(sources) >= num_sources * len(search_queries):
+        # A couple of extra results per query serve as fallbacks for failed extractions
+        all_results = list(executor.map(lambda sq: tavily.search(query=sq, max_results=num_sources + 2), search_queries))
+        # Queries often return the same popular URL; fetch each one once (first query wins)
+        url_queries = {}
+        spare_urls = {}
+        for sq, search_results in zip(search_queries, all_results):
+            pending.append((sq, json.dumps(search_results, separators=(',', ':')), datetime.now().isoformat()))
+            urls = [result['url'] for result in search_results['results']]
+            for url in urls[:num_sources]:
+                url_queries.setdefault(url, sq)
+            spare_urls[sq] = urls[num_sources:]
+        seen = set(url_queries)
+        spares = {}
+        for sq, urls in spare_urls.items():
+            spares[sq] = deque(url for url in urls if url not in seen)
+            seen.update(urls)
+        futures = {executor.submit(extract_source, url, sq, goal, spares[sq]): sq for url, sq in url_queries.items()}
+
+        for future in as_completed(futures):
+            try:
+                source = future.result()
+            except Exception:
+                continue
+            if source:
+                sources.append(source)
+            if len(sources) >= max_sources:
                 break
     except Exception as e:
         st.error(f"Search failed: {str(e)}")
+    finally:
+        # Don't wait for extractions that are no longer needed
+        executor.shutdown(wait=False, cancel_futures=True)
     
+    store_queries(pending)
     return sources[:9]  # Cap at reasonable number to avoid overload
 
 # Function to break goal into steps using Gemini
 def break_into_steps(goal):
     prompt = f"Break the following general goal into 5-10 actionable steps: {goal}"
     try:
-        response = model.generate_content(prompt)
-        steps = response.text.split('\n')
+        steps = cached_generate(prompt).split('\n')
         return [step.strip() for step in steps if step.strip()]
     except Exception as e:
         return []
@@ -208,39 +452,81 @@ For a {days}-day plan, assign activities to each day logically. Include:
 Structure as: Day 1: [emoji] Overview... then bullet points for steps with emojis and links/images where possible."""
     
     try:
-        response = model.generate_content(prompt)
-        plan = response.text
+        plan = cached_generate(prompt)
         # Enhance with emojis if not already
-        plan = re.sub(r'(Day \d+:)', r'📅 \1', plan)
-        plan = re.sub(r'(- |• )', r'✅ \1', plan)
+        plan = _DAY_RE.sub(r'📅 \1', plan)
+        plan = _BULLET_RE.sub(r'✅ \1', plan)
         return plan
     except Exception as e:
         return f"Error generating plan: {str(e)}"
 
 # Database functions
+# BEGIN IMMEDIATE takes the write lock up front, so a write never fails with SQLITE_BUSY halfway through
 def store_plan(goal, plan):
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
     timestamp = datetime.now().isoformat()  # Convert to ISO 8601 string
-    c.execute("INSERT INTO plans (goal, plan, timestamp) VALUES (?, ?, ?)", (goal, plan, timestamp))
-    conn.commit()
-    conn.close()
+    with pool.writer() as c:
+        c.execute("BEGIN IMMEDIATE")
+        c.execute("INSERT INTO plans (goal, plan, timestamp) VALUES (?, ?, ?)", (goal, plan, timestamp))
+        c.execute("COMMIT")
 
-def store_query(query, results):
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    timestamp = datetime.now().isoformat()  # Convert to ISO 8601 string
-    c.execute("INSERT INTO queries (query, results, timestamp) VALUES (?, ?, ?)", (query, str(results), timestamp))
-    conn.commit()
-    conn.close()
+# All of a search's query rows go in with one executemany inside a single transaction
+def store_queries(rows):
+    if not rows:
+        return
+    with pool.writer() as c:
+        c.execute("BEGIN IMMEDIATE")
+        c.executemany("INSERT INTO queries (query, results, timestamp) VALUES (?, ?, ?)", rows)
+        c.execute("COMMIT")
+
+# Semantic plan cache: near-duplicate goals ("weekend trip to Paris" vs "Paris weekend
+# getaway") reuse a stored plan instead of re-running search and generation.
+# Embeddings are stored unit-normalized, so cosine similarity is a single matrix-vector product.
+EMBEDDING_MODEL = 'models/text-embedding-004'
+PLAN_SIMILARITY_THRESHOLD = 0.92
+PLAN_CACHE_CANDIDATES = 500
+
+# Errors propagate, so failed embedding calls are not memoized
+@lru_cache(maxsize=256)
+def embed_goal(goal):
+    emb = np.asarray(genai.embed_content(model=EMBEDDING_MODEL, content=goal)['embedding'], dtype=np.float32)
+    return emb / (np.linalg.norm(emb) or 1.0)
+
+# Plans are only reused for the same number of days
+def find_similar_plan(goal, days):
+    try:
+        q = embed_goal(goal)
+        since = (datetime.now() - LLM_CACHE_TTL).isoformat()
+        with pool.reader() as c:
+            rows = c.execute("SELECT embedding, plan FROM plan_embeddings WHERE days = ? AND timestamp >= ? "
+                             "ORDER BY timestamp DESC LIMIT ?", (days, since, PLAN_CACHE_CANDIDATES)).fetchall()
+        if not rows:
+            return None
+        embeddings = np.vstack([np.frombuffer(e, dtype=np.float32) for e, _ in rows])
+        sims = embeddings @ q
+        best = int(np.argmax(sims))
+        return rows[best][1] if sims[best] >= PLAN_SIMILARITY_THRESHOLD else None
+    except Exception:
+        return None
+
+def store_plan_embedding(goal, days, plan):
+    try:
+        emb = embed_goal(goal)
+    except Exception:
+        return
+    with pool.writer() as c:
+        c.execute("BEGIN IMMEDIATE")
+        c.execute("INSERT INTO plan_embeddings (goal, days, embedding, plan, timestamp) VALUES (?, ?, ?, ?, ?)",
+                  (goal, days, emb.tobytes(), plan, datetime.now().isoformat()))
+        c.execute("COMMIT")
 
 def get_all_plans():
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute("SELECT goal, plan, timestamp FROM plans ORDER BY timestamp DESC")
-    plans = c.fetchall()
-    conn.close()
-    return plans
+    with pool.reader() as c:
+        return c.execute("SELECT goal, plan, timestamp FROM plans ORDER BY timestamp DESC").fetchall()
+
+# History memoized across reruns; cleared whenever a new plan is stored
+@st.cache_data(ttl=60, show_spinner=False)
+def get_all_plans_cached():
+    return get_all_plans()
 
 # Streamlit app
 st.title("Task Planning Agent")
@@ -256,45 +542,54 @@ if st.button("Generate Plan"):
             # Extract number of days
             days = extract_num_days(goal)
             
-            # Break into steps
-            steps = break_into_steps(goal)
-            if not steps:
-                st.error("Failed to break goal into steps.")
+            # Reuse the plan of a near-duplicate goal with the same day count,
+            # skipping search and generation
+            similar_plan = find_similar_plan(goal, days)
+            if similar_plan:
+                st.info("Reusing the plan generated for a similar goal.")
+                st.markdown("### Generated Plan")
+                st.markdown(similar_plan)
             else:
-                # Find sources with refined searches
-                sources = find_and_extract_sources(goal)
-                if len(sources) < 2:
-                    st.warning("Limited sources found, proceeding with available.")
+                # Break into steps
+                steps = break_into_steps(goal)
+                if not steps:
+                    st.error("Failed to break goal into steps.")
+                else:
+                    # Find sources with refined searches
+                    sources = find_and_extract_sources(goal)
+                    if len(sources) < 2:
+                        st.warning("Limited sources found, proceeding with available.")
                 
-                # Get weather if needed
-                weather = None
-                if needs_weather(goal):
-                    # Extract city from goal
-                    city_prompt = f"Extract the main city from this goal: {goal}. Output only the city name."
-                    try:
-                        city_response = model.generate_content(city_prompt)
-                        city = city_response.text.strip()
-                        if city:
-                            weather = get_weather(city, days)
-                            if not weather:
-                                st.warning("Failed to fetch weather forecast.")
-                    except Exception as e:
-                        st.warning("Failed to extract city or fetch weather.")
+                    # Get weather if needed
+                    weather = None
+                    if needs_weather(goal):
+                        # Extract city from goal
+                        city_prompt = f"Extract the main city from this goal: {goal}. Output only the city name."
+                        try:
+                            city = cached_generate(city_prompt).strip()
+                            if city:
+                                weather = get_weather(city, days)
+                                if not weather:
+                                    st.warning("Failed to fetch weather forecast.")
+                        except Exception as e:
+                            st.warning("Failed to extract city or fetch weather.")
                 
-                # Generate plan
-                plan = generate_plan(goal, steps, sources, weather, days)
-                if "Error" in plan:
-                    st.error(plan)
-                else:
-                    st.markdown("### Generated Plan")
-                    st.markdown(plan)
+                    # Generate plan
+                    plan = generate_plan(goal, steps, sources, weather, days)
+                    if "Error" in plan:
+                        st.error(plan)
+                    else:
+                        st.markdown("### Generated Plan")
+                        st.markdown(plan)
                     
-                    # Store plan
-                    store_plan(goal, plan)
+                        # Store plan
+                        store_plan(goal, plan)
+                        store_plan_embedding(goal, days, plan)
+                        get_all_plans_cached.clear()
 
 # Display history
 st.markdown("### History of Plans")
-plans = get_all_plans()
+plans = get_all_plans_cached()
 for g, plan, timestamp in plans:
     with st.expander(f"Goal: {g} (Created: {timestamp})"):
         st.markdown(plan)
\ No newline at end of file
@@ -5,24 +5,66 @@ Handles generating search queries, performing web searches with Tavily,
 extracting content from URLs, and finding alternative URLs if extraction fails.
 """
 
-import os
+import io
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from tavily import TavilyClient
 from readability import Document
 import trafilatura
 from pypdf import PdfReader
-import tempfile
-import json
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from collections import deque
+from itertools import chain, zip_longest
+import orjson
 from datetime import datetime
 from config import TAVILY_API_KEY, GEMINI_API_KEY
 import google.generativeai as genai
 import re
-from database import store_query
+import threading
+from database import store_queries_bulk
+from llm_cache import cached_generate, response_cache
 # Configure APIs
 genai.configure(api_key=GEMINI_API_KEY)
 model = genai.GenerativeModel('gemini-1.5-flash')
 tavily = TavilyClient(api_key=TAVILY_API_KEY)
 
+# Maximum number of URLs fetched and extracted at once
+MAX_FETCH_WORKERS = 8
+
+# Extractions started beyond num_sources up front, to absorb a failure or two
+EXTRACT_MARGIN = 1
+
+# Download caps for fetched pages (bytes)
+MAX_HTML_BYTES = 2_000_000
+MAX_PDF_BYTES = 20_000_000
+
+# Only this much page text is sent to Gemini for extraction
+MAX_EXTRACT_CHARS = 10000
+
+# Items of a numbered list ("1. query" or "1) query"), one per line
+_NUM_RE = re.compile(r'^\s*\d+[.)]\s*(.+?)\s*$', re.MULTILINE)
+
+# Prompt templates (str.format); kept in one place so prompt edits are easy to spot
+_QUERIES_PROMPT = """From the general goal '{goal}', suggest 3 specific, targeted search queries for finding relevant sources 
+    (e.g., locations, details, itineraries, tips, learning resources, videos, courses, general info). Make them versatile 
+    for ANY type of goal, including travel, learning, tasks, or anything else. Prioritize high-quality, authoritative sites.
+    Output as a numbered list, one per line."""
+
+_EXTRACT_PROMPT = """Extract only the most relevant information from the following text related to '{query}'. 
+        Focus on key details: names of locations/places (if relevant to query), addresses, Google Maps/business links, 
+        opening hours, descriptions, learning resources/videos/courses (with direct URLs if available), tips, general info. 
+        If the query is about learning/videos/courses, highlight best resource links. Be concise, output only key points, 
+        no more than 500 words. If no locations involved, omit them entirely.
+        
+        Text: {text}"""
+
+# Shared HTTP session so connections to repeat hosts are kept alive between fetches
+_session = requests.Session()
+_retry_adapter = HTTPAdapter(pool_connections=32, pool_maxsize=32, max_retries=Retry(total=2, backoff_factor=0.2))
+_session.mount('http://', _retry_adapter)
+_session.mount('https://', _retry_adapter)
+
 def generate_search_queries(goal):
     """
     Generate 3 specific search queries from the goal using Gemini.
@@ -34,21 +76,18 @@ def generate_search_queries(goal):
     Returns:
         list: List of 3 search queries.
     """
-    prompt = f"""From the general goal '{goal}', suggest 3 specific, targeted search queries for finding relevant sources 
-    (e.g., locations, details, itineraries, tips, learning resources, videos, courses, general info). Make them versatile 
-    for ANY type of goal, including travel, learning, tasks, or anything else. Prioritize high-quality, authoritative sites.
-    Output as a numbered list, one per line."""
+    prompt = _QUERIES_PROMPT.format(goal=goal)
     try:
-        response = model.generate_content(prompt)
-        queries = [q.strip() for q in response.text.split('\n') if q.strip() and q[0].isdigit()]
-        return [q.split('.', 1)[1].strip() for q in queries[:3]]
+        queries = _NUM_RE.findall(cached_generate(model, prompt))[:3]
     except Exception:
-        return [goal, f"best guide for {goal}", f"detailed resources for {goal}"]
+        queries = []
+    return queries or [goal, f"best guide for {goal}", f"detailed resources for {goal}"]
 
 def extract_relevant_content(url, query):
     """
     Extract relevant content from a URL, handling HTML and PDF.
     Universal extraction focused on key details.
+    Successful Gemini extractions are cached per (url, query) for the cache TTL.
     
     Args:
         url (str): URL to extract from.
@@ -57,51 +96,100 @@ def extract_relevant_content(url, query):
     Returns:
         str or None: Extracted relevant text.
     """
+    # A warm hit skips the page fetch as well as the Gemini call
+    cache_prompt = f"extract\0{url}\0{query}"
+    cached = response_cache.get(cache_prompt)
+    if cached is not None:
+        return cached
     try:
-        response = requests.get(url, timeout=10)
-        if response.status_code != 200:
-            return None
-        
-        content_type = response.headers.get('Content-Type', '').lower()
+        # Stream the body and stop at a size cap, so huge pages don't stall the batch.
+        # A truncated PDF can't be parsed, so oversized PDFs are skipped instead.
+        with _session.get(url, stream=True, timeout=(5, 10)) as response:
+            if response.status_code != 200:
+                return None
+            content_type = response.headers.get('Content-Type', '').lower()
+            is_pdf = 'pdf' in content_type or url.endswith('.pdf')
+            limit = MAX_PDF_BYTES if is_pdf else MAX_HTML_BYTES
+            body = bytearray()
+            for chunk in response.iter_content(65536):
+                body.extend(chunk)
+                if len(body) > limit:
+                    if is_pdf:
+                        return None
+                    break
+            encoding = response.encoding or 'utf-8'
         
-        if 'pdf' in content_type or url.endswith('.pdf'):
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as tmp:
-                tmp.write(response.content)
-                tmp_path = tmp.name
-            reader = PdfReader(tmp_path)
-            text = ""
+        if is_pdf:
+            reader = PdfReader(io.BytesIO(body))
+            parts = []
+            total = 0
             for page in reader.pages:
-                text += page.extract_text() + "\n"
-            os.unlink(tmp_path)
+                page_text = page.extract_text() or ""
+                parts.append(page_text)
+                total += len(page_text) + 1
+                if total >= MAX_EXTRACT_CHARS:
+                    break  # Later pages would be truncated away
+            text = "\n".join(parts)
         else:
-            doc = Document(response.text)
-            summary = doc.summary()
-            text = trafilatura.extract(response.text) or summary
+            # readability parses the whole document again, so only use it if trafilatura finds nothing
+            html = body.decode(encoding, errors='replace')
+            text = trafilatura.extract(html) or Document(html).summary()
         
         if not text:
             return None
+        text = text[:MAX_EXTRACT_CHARS]
         
         # Use Gemini to extract relevant parts universally
-        prompt = f"""Extract only the most relevant information from the following text related to '{query}'. 
-        Focus on key details: names of locations/places (if relevant to query), addresses, Google Maps/business links, 
-        opening hours, descriptions, learning resources/videos/courses (with direct URLs if available), tips, general info. 
-        If the query is about learning/videos/courses, highlight best resource links. Be concise, output only key points, 
-        no more than 500 words. If no locations involved, omit them entirely.
-        
-        Text: {text[:10000]}"""
+        prompt = _EXTRACT_PROMPT.format(query=query, text=text)
         try:
-            gemini_response = model.generate_content(prompt)
-            return gemini_response.text
+            relevant_text = model.generate_content(prompt).text
         except Exception:
             return text[:2000]
+        response_cache.set(cache_prompt, relevant_text)
+        return relevant_text
     except Exception:
         return None
 
+def _extract_source(url, search_query, goal, claim_url=None):
+    """
+    Extract a single search result. If extraction fails, search for the most
+    relevant alternative URL and try that instead.
+
+    Args:
+        url (str): Result URL.
+        search_query (str): Search query that produced the result.
+        goal (str): User's goal.
+        claim_url (callable, optional): Returns False for an alternative URL that
+            is already being extracted elsewhere, so it is skipped.
+
+    Returns:
+        dict or None: Source dict with 'url', 'content', 'search_query'.
+    """
+    content = extract_relevant_content(url, goal)
+    if content:
+        return {'url': url, 'content': content, 'search_query': search_query}
+
+    # Find alternative
+    alt_search = tavily.search(query=f"alternative high-quality site for {search_query} {goal}", max_results=1)
+    if alt_search['results']:
+        alt_url = alt_search['results'][0]['url']
+        if claim_url is not None and not claim_url(alt_url):
+            return None
+        alt_content = extract_relevant_content(alt_url, goal)
+        if alt_content:
+            return {'url': alt_url, 'content': alt_content, 'search_query': search_query}
+    return None
+
 def find_and_extract_sources(goal, num_sources=3):
     """
     Find and extract sources using refined queries. If extraction fails for a source,
     automatically find and use the most relevant alternative URL.
     Universal for any goal.
+
+    The searches run concurrently, then num_sources result URLs (plus a small margin)
+    are fetched and extracted in parallel, with the next candidate started whenever
+    one fails; sources are taken in completion order until num_sources is reached.
+    If too few succeed, one extra search tops them up, again extracted in parallel.
     
     Args:
         goal (str): User's goal.
@@ -111,46 +199,65 @@ def find_and_extract_sources(goal, num_sources=3):
         list: List of dicts with 'url', 'content', 'search_query'.
     """
     sources = []
+    query_rows = []  # Queued for the background writer once the search is done
     search_queries = generate_search_queries(goal)
+
+    # Queries often return overlapping results; each URL is fetched at most once
+    seen_urls = set()
+    seen_lock = threading.Lock()
+
+    def claim_url(url):
+        with seen_lock:
+            if url in seen_urls:
+                return False
+            seen_urls.add(url)
+            return True
+
+    executor = ThreadPoolExecutor(max_workers=MAX_FETCH_WORKERS)
+    try:
+        all_results = executor.map(lambda sq: tavily.search(query=sq, max_results=num_sources), search_queries)
+
+        per_query = []
+        for sq, search_results in zip(search_queries, all_results):
+            query_rows.append((sq, orjson.dumps(search_results).decode(), datetime.now().isoformat()))
+            per_query.append([(result['url'], sq) for result in search_results['results']])
+
+        # Candidates alternate between queries, so the first extractions cover every query
+        candidates = deque((url, sq) for url, sq in chain.from_iterable(zip_longest(*per_query, fillvalue=(None, None)))
+                           if url is not None and claim_url(url))
+
+        def submit_next():
+            url, sq = candidates.popleft()
+            return executor.submit(_extract_source, url, sq, goal, claim_url)
+
+        # Only num_sources (plus a margin) extractions run at once; each failure starts the next candidate
+        in_flight = {submit_next() for _ in range(min(num_sources + EXTRACT_MARGIN, len(candidates)))}
+        while in_flight and len(sources) < num_sources:
+            done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    source = future.result()
+                except Exception:
+                    source = None
+                if source:
+                    sources.append(source)
+                elif candidates:
+                    in_flight.add(submit_next())
+    finally:
+        # Don't wait for extractions that are no longer needed
+        executor.shutdown(wait=False, cancel_futures=True)
     
-    for sq in search_queries:
-        search_results = tavily.search(query=sq, max_results=num_sources)
-        store_query(sq, json.dumps(search_results), datetime.now().isoformat())  # Store query
-        
-        for result in search_results['results']:
-            url = result['url']
-            content = extract_relevant_content(url, goal)
-            
-            if content:
-                sources.append({'url': url, 'content': content, 'search_query': sq})
-            else:
-                # Find alternative
-                alt_search = tavily.search(query=f"alternative high-quality site for {sq} {goal}", max_results=1)
-                if alt_search['results']:
-                    alt_url = alt_search['results'][0]['url']
-                    alt_content = extract_relevant_content(alt_url, goal)
-                    if alt_content:
-                        sources.append({'url': alt_url, 'content': alt_content, 'search_query': sq})
-                    else:
-                        # Fallback to next result if available
-                        continue
-                else:
-                    continue
-            
-            if len(sources) >= num_sources:
-                break
-        
-        if len(sources) >= num_sources:
-            break
-    
-    # Ensure exactly num_sources by adding more if needed
-    while len(sources) < num_sources:
+    # Top up to num_sources with one extra search whose results are extracted concurrently
+    missing = num_sources - len(sources)
+    if missing > 0:
         fallback_query = f"additional relevant resources for {goal}"
-        fallback_results = tavily.search(query=fallback_query, max_results=1)
-        if fallback_results['results']:
-            fb_url = fallback_results['results'][0]['url']
-            fb_content = extract_relevant_content(fb_url, goal)
-            if fb_content:
-                sources.append({'url': fb_url, 'content': fb_content, 'search_query': fallback_query})
+        fallback_results = tavily.search(query=fallback_query, max_results=missing + 2)
+        fb_urls = [r['url'] for r in fallback_results['results'] if claim_url(r['url'])]
+        with ThreadPoolExecutor(max_workers=MAX_FETCH_WORKERS) as fb_executor:
+            fb_contents = fb_executor.map(lambda u: extract_relevant_content(u, goal), fb_urls)
+            for fb_url, fb_content in zip(fb_urls, fb_contents):
+                if fb_content and len(sources) < num_sources:
+                    sources.append({'url': fb_url, 'content': fb_content, 'search_query': fallback_query})
     
+    store_queries_bulk(query_rows)
     return sources[:num_sources]
\ No newline at end of file
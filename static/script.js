@@ -27,7 +27,7 @@ document.addEventListener('DOMContentLoaded', () => {
     // Load history on page load
     loadHistory();
 
-    generateBtn.addEventListener('click', async () => {
+    generateBtn.addEventListener('click', () => {
         const goal = goalInput.value.trim();
         if (!goal) {
             alert('Please enter a goal!');
@@ -46,73 +46,81 @@ document.addEventListener('DOMContentLoaded', () => {
         searchAnimation.classList.add('hidden');
         generatingMessage.classList.add('hidden');
 
-        try {
-            const response = await fetch('/generate_plan', {
-                method: 'POST',
-                headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({ goal })
-            });
-
-            if (!response.ok) {
-                const data = await response.json();
-                progressMessage.textContent = data.error || 'An error occurred.';
-                return;
-            }
-
-            const data = await response.json();
-
-            // Animate search links
-            const links = data.sources || [];
-            for (let i = 0; i < links.length; i++) {
-                setTimeout(() => {
-                    const linkItem = document.getElementById(`link-${i + 1}`);
-                    const linkUrl = document.getElementById(`link-url-${i + 1}`);
-                    linkUrl.href = links[i].url;
-                    linkUrl.textContent = `Link ${i + 1}: ${links[i].search_query}`;
-                    linkItem.classList.remove('hidden');
-                    linkItem.classList.add('visible');
-                    searchAnimation.classList.remove('hidden');
-                }, i * 1500);  // Stagger by 1.5s
-            }
+        // Stream progress, sources and plan tokens from the server as they are produced
+        const progressFill = document.querySelector('.progress-fill');
+        const eventSource = new EventSource(`/generate_plan_stream?goal=${encodeURIComponent(goal)}`);
+        let planText = '';
 
-            // Simulate progress bar
-            let progress = 0;
-            const interval = setInterval(() => {
-                progress += 10;
-                document.querySelector('.progress-fill').style.width = `${progress}%`;
-                if (progress >= 100) clearInterval(interval);
-            }, 500);
-
-            // After searches, show generating
-            setTimeout(() => {
+        const resetGenerateBtn = () => {
+            generateBtn.disabled = false;
+            generateBtn.textContent = 'Generate Answer ✨';
+        };
+
+        eventSource.addEventListener('progress', (event) => {
+            const data = JSON.parse(event.data);
+            progressMessage.textContent = data.message;
+            if (data.step === 'searching') {
+                progressFill.style.width = '10%';
+            } else if (data.step === 'generating') {
+                progressFill.style.width = '70%';
                 searchAnimation.classList.add('hidden');
                 [...searchAnimation.children].forEach(child => {
                     child.classList.remove('visible');
                     child.classList.add('hidden');
                 });
                 generatingMessage.classList.remove('hidden');
-                progressMessage.textContent = 'Finalizing your answer...';
-            }, links.length * 1500 + 1000);
+            }
+        });
+
+        eventSource.addEventListener('sources', (event) => {
+            const links = JSON.parse(event.data).sources || [];
+            links.slice(0, 3).forEach((link, i) => {
+                const linkItem = document.getElementById(`link-${i + 1}`);
+                const linkUrl = document.getElementById(`link-url-${i + 1}`);
+                linkUrl.href = link.url;
+                linkUrl.textContent = `Link ${i + 1}: ${link.search_query}`;
+                linkItem.classList.remove('hidden');
+                linkItem.classList.add('visible');
+            });
+            searchAnimation.classList.remove('hidden');
+            progressFill.style.width = '50%';
+        });
 
-            // Show plan
-            setTimeout(() => {
+        eventSource.addEventListener('token', (event) => {
+            if (!planText) {
                 progressSection.classList.add('hidden');
-                planContent.innerHTML = marked.parse(data.plan || 'No response generated.');
                 planSection.classList.remove('hidden');
-                planSection.scrollIntoView({ behavior: 'smooth' });
-                generateBtn.disabled = false;
-                generateBtn.textContent = 'Generate Answer ✨';
-                goalInput.value = '';  // Clear input
-                loadHistory();  // Refresh history to include new plan
-                currentEditId = data.id;  // Set for editing
-                editPlanBtn.classList.remove('hidden');
-            }, links.length * 1500 + 3000);
-
-        } catch (error) {
-            progressMessage.textContent = 'Network error. Please try again.';
-            generateBtn.disabled = false;
-            generateBtn.textContent = 'Generate Answer ✨';
-        }
+                editPlanBtn.classList.add('hidden');
+            }
+            planText += JSON.parse(event.data).token;
+            planContent.innerHTML = marked.parse(planText);
+        });
+
+        eventSource.addEventListener('complete', (event) => {
+            // Close before the server ends the stream, otherwise EventSource reconnects
+            eventSource.close();
+            const data = JSON.parse(event.data);
+            progressFill.style.width = '100%';
+            progressSection.classList.add('hidden');
+            planContent.innerHTML = marked.parse(data.plan || 'No response generated.');
+            planSection.classList.remove('hidden');
+            planSection.scrollIntoView({ behavior: 'smooth' });
+            resetGenerateBtn();
+            goalInput.value = '';  // Clear input
+            loadHistory();  // Refresh history to include new plan
+            currentEditId = data.id;  // Set for editing
+            editPlanBtn.classList.remove('hidden');
+        });
+
+        // Fired both for server-sent 'error' events (with data) and for connection failures
+        eventSource.addEventListener('error', (event) => {
+            eventSource.close();
+            const message = event.data ? JSON.parse(event.data).error : 'Network error. Please try again.';
+            planSection.classList.add('hidden');
+            progressSection.classList.remove('hidden');
+            progressMessage.textContent = message || 'An error occurred.';
+            resetGenerateBtn();
+        });
     });
 
     newPlanBtn.addEventListener('click', () => {
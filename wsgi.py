@@ -0,0 +1,22 @@
+# wsgi.py
+"""
+WSGI entry point for production servers.
+Run with: gunicorn -k gevent --worker-connections 1000 -w $(nproc) wsgi:app
+
+gevent's monkey patching must happen before anything imports requests or
+google.generativeai, so that blocking socket I/O (Tavily, page fetches,
+Open-Meteo) yields to other requests. Gemini calls go over gRPC, which
+monkey patching does not reach, so gRPC is switched to its gevent-aware
+polling as well. sqlite3 is a C extension and stays blocking; its calls are
+short local reads and writes.
+"""
+
+from gevent import monkey
+
+monkey.patch_all()
+
+from grpc.experimental import gevent as grpc_gevent  # noqa: E402
+
+grpc_gevent.init_gevent()
+
+from app import app  # noqa: E402
\ No newline at end of file